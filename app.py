@@ -5,15 +5,13 @@ import streamlit as st
 import pandas as pd
 
 from config import DEFAULT_BILL_CYCLES, DEBTS, REGULARS
-from data import load_csv, validate_dataframe, compute_monthly_for_trends
-from helpers import normalize_columns, detect_card, get_active_cycles
+from data import load_csv, card_labels, validate_dataframe, compute_monthly_for_trends
+from helpers import get_active_cycles
 from ui_sections import (
     diagnostics_section,
     start_balance_override_section,
     debt_summary_section,
-    per_card_dates_editor_section,
-    bills_tabs_section,
-    quick_due_selector_section,
+    bills_section,
     regulars_section,
     cashflow_section,
     expenses_by_card_section,
@@ -64,14 +62,15 @@ with st.sidebar.expander("➕ Extra inflows (dated)", expanded=False):
         num_rows="dynamic",
         use_container_width=True,
     )
+    # column-wise: parse/round whole columns, then zip them back into records (rows without a date are dropped)
+    n = len(edited)
+    dates = pd.to_datetime(edited["Date"] if "Date" in edited else pd.Series([None] * n, dtype=object), errors="coerce")
+    sources = edited["Source"].fillna("").astype(str) if "Source" in edited else pd.Series([""] * n)
+    amounts = pd.to_numeric(edited["Amount"], errors="coerce").fillna(0.0).round(2) if "Amount" in edited else pd.Series([0.0] * n)
+    keep = dates.notna().to_numpy()
     st.session_state.extra_inflows = [
-        {
-            "Date": (r["Date"] if isinstance(r["Date"], date) else (pd.to_datetime(r["Date"]).date() if pd.notna(r["Date"]) else None)),
-            "Source": str(r.get("Source", "") or ""),
-            "Amount": round(float(r.get("Amount", 0) or 0), 2),
-        }
-        for _, r in edited.iterrows()
-        if r.get("Date") is not None
+        {"Date": d, "Source": s, "Amount": float(a)}
+        for d, s, a in zip(dates[keep].dt.date, sources[keep], amounts[keep])
     ]
 
 # ---------------- Upload ----------------
@@ -81,22 +80,15 @@ if not uploaded:
     st.stop()
 
 # ---------------- Load & normalize ----------------
-df_raw = load_csv(uploaded)                 # rounds Amount to 2 decimals
-df_raw = normalize_columns(df_raw)          # fixes header variants (Payment mode, etc.)
+csv_data = uploaded.getvalue()
+df = load_csv(csv_data)  # normalized headers, parsed dates, Amount rounded to 2 decimals
 
 # Validate required columns after normalization
-ok, missing_cols = validate_dataframe(df_raw)
+ok, missing_cols = validate_dataframe(df)
 if not ok:
     st.error(f"CSV missing required columns (after normalization): {missing_cols}")
     st.stop()
 
-# Derived DF
-df = df_raw.copy()
-df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-df = df[df["Date"].notna()].copy()
-df["Amount"] = pd.to_numeric(df["Amount"], errors="coerce").fillna(0.0).round(2)
-df["type"] = df["type"].fillna("").astype(str)
-
 # Session state holders
 for key, default in [
     ("auto_overrides", {}),
@@ -120,14 +112,18 @@ except Exception:
     user_overrides = {}
     st.sidebar.warning("Invalid JSON; overrides ignored.")
 
-# Card detection
-df["Card"] = df["Payment mode"].apply(lambda x: detect_card(x, user_overrides))
+# Card detection (auto mappings from the diagnostics UI win over the JSON overrides)
+card_overrides = (tuple(user_overrides.items()), tuple(st.session_state.auto_overrides.items()))
+df["Card"] = card_labels(csv_data, *card_overrides)
+# The upload and the overrides fully determine df, so derived-frame caches key on this
+# instead of hashing the frame on every call.
+data_key = (uploaded.file_id, card_overrides)
 
 # Active BILL_CYCLES (merge defaults + newly added cards)
 BILL_CYCLES = get_active_cycles(DEFAULT_BILL_CYCLES)
 
 # ---------------- UI sections ----------------
-diagnostics_section(df, BILL_CYCLES)
+diagnostics_section(df, data_key, BILL_CYCLES)
 
 start_balance_effective, extra_buffer_effective = start_balance_override_section(
     start_balance_sb, extra_buffer_sb
@@ -135,14 +131,8 @@ start_balance_effective, extra_buffer_effective = start_balance_override_section
 
 debt_summary_section(DEBTS)
 
-# Bills — month local to this section
-bills_anchor, by_y, by_m = per_card_dates_editor_section(BILL_CYCLES, today)
-
-# Two-tab bills
-card_gen_df, card_due_df = bills_tabs_section(df, BILL_CYCLES, bills_anchor, by_y, by_m)
-
-# Quick selector based on bills anchor
-quick_due_selector_section(df, BILL_CYCLES, bills_anchor)
+# Bills — month local to this section (two tabs + quick selector based on bills anchor)
+bills_section(df, data_key, BILL_CYCLES, today)
 
 # Regular expenses (+ paid toggles) for sidebar month
 cash_out_df = regulars_section(today, DEBTS, REGULARS)
@@ -150,6 +140,7 @@ cash_out_df = regulars_section(today, DEBTS, REGULARS)
 # Cash flow simulator (uses income, overrides)
 cashflow_section(
     df=df,
+    data_key=data_key,
     BILL_CYCLES=BILL_CYCLES,
     today=today,
     salary_amount=salary_amount,
@@ -160,14 +151,14 @@ cashflow_section(
 )
 
 # Expenses by card (generating in sidebar month)
-expenses_by_card_section(df, BILL_CYCLES, today)
+expenses_by_card_section(df, data_key, BILL_CYCLES, today)
 
 # Top merchants
-merchants_section(df, BILL_CYCLES, today)
+merchants_section(df, data_key, BILL_CYCLES, today)
 
 # Trends
-monthly = compute_monthly_for_trends(df)  # already rounded to 2 decimals
-trends_section(monthly, BILL_CYCLES, today)
+monthly = compute_monthly_for_trends(data_key, df)  # already rounded to 2 decimals
+trends_section(monthly, data_key, BILL_CYCLES, today)
 
 # 1-year plan
 plan_section(DEBTS, REGULARS)
@@ -1,30 +1,163 @@
 # data.py
+import io
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+from helpers import (
+    detect_cards, expense_mask, expense_rows_by_card, liability_totals, normalize_columns, parse_dates, hint_due_dates,
+)
+
 REQUIRED_COLS = {"Date", "Amount", "Payment mode", "type"}
 
+def read_csv_bytes(data: bytes) -> pd.DataFrame:
+    # pyarrow (multi-threaded) parser; it ships with streamlit. Exports it rejects fall back to the C engine.
+    # Date stays text on both paths: pyarrow would convert offset timestamps to UTC itself, so parse_dates owns it.
+    header = pd.read_csv(io.BytesIO(data), nrows=0).columns
+    date_cols = [raw for raw, canon in zip(header, normalize_columns(pd.DataFrame(columns=header)).columns) if canon == "Date"]
+    try:
+        import pyarrow as pa
+        from pyarrow import csv as pa_csv
+        opts = pa_csv.ConvertOptions(column_types={c: pa.string() for c in date_cols}, strings_can_be_null=True)
+        return pa_csv.read_csv(io.BytesIO(data), convert_options=opts).to_pandas()
+    except (ImportError, ValueError):
+        return pd.read_csv(io.BytesIO(data), dtype={c: str for c in date_cols})
+
 @st.cache_data(show_spinner=False)
-def load_csv(uploaded) -> pd.DataFrame:
-    df = pd.read_csv(uploaded)
-    if "Amount" in df.columns:
-        df["Amount"] = pd.to_numeric(df["Amount"], errors="coerce").fillna(0.0).round(2)
+def load_csv(data: bytes) -> pd.DataFrame:
+    # Parse + normalize once per upload (keyed on the file bytes); reruns get a cached copy.
+    df = normalize_columns(read_csv_bytes(data))
+    if not validate_dataframe(df)[0]:
+        return df
+    df["Date"] = parse_dates(df["Date"])
+    bad_dates = df["Date"].isna()
+    if bad_dates.any():
+        df = df.drop(index=df.index[bad_dates])
+    df["Amount"] = pd.to_numeric(df["Amount"], errors="coerce").fillna(0.0).round(2)
+    df["type"] = df["type"].fillna("").astype(str)
+    df["_is_expense"] = df["type"].str.lower().eq("expense")  # lowercased once, reused by every section
+    # Low-cardinality labels as category: masks and groupbys run on integer codes
+    for col in ("type", "Category", "Payment mode"):
+        if col in df.columns:
+            df[col] = df[col].astype("category")
     return df
 
+@st.cache_data(show_spinner=False)
+def card_labels(data: bytes, user_overrides: tuple, auto_overrides: tuple) -> pd.Series:
+    # Detected Card column (categorical), keyed on the upload and both override sets:
+    # reruns that change none of them skip the detection pass.
+    return detect_cards(load_csv(data)["Payment mode"], dict(user_overrides), dict(auto_overrides)).astype("category")
+
+@st.cache_data(show_spinner=False)
+def items_frame(items: list) -> pd.DataFrame:
+    # Config item lists (DEBTS, REGULARS) as frames: built once, not on every widget rerun.
+    return pd.DataFrame(items)
+
+def debt_summary(debts: list):
+    # (tracked outstanding, monthly EMI total). "Tracked" = an int tenure_left,
+    # which leaves out open-ended entries like the Home Loan's "~95".
+    tracked = sum(d["outstanding"] for d in debts if isinstance(d["tenure_left"], int))
+    return float(tracked), float(sum(d["amount"] for d in debts))
+
+@st.cache_data(show_spinner=False)
+def cash_out_frame(regulars: list, debts: list, y: int, m: int) -> pd.DataFrame:
+    # This month's regulars + EMIs (Item, Amount, Due Date, Type, Key), sorted by due date.
+    # Depends only on the config lists and the month, so it is built once per month.
+    regs, emis = pd.DataFrame(regulars), pd.DataFrame(debts)
+    cash_out_df = pd.concat([
+        pd.DataFrame({
+            "Item": regs["item"], "Amount (₹)": regs["amount"].astype(float).round(2),
+            "Due Date": list(hint_due_dates(tuple(regs["date_hint"]), y, m)), "Type": "Regular",
+        }),
+        pd.DataFrame({
+            "Item": emis["item"], "Amount (₹)": emis["amount"].astype(float).round(2),
+            "Due Date": list(hint_due_dates(tuple(emis["due_day"]), y, m)), "Type": emis["type"],
+        }),
+    ], ignore_index=True).sort_values(by="Due Date")
+    cash_out_df["Key"] = "CASH::" + cash_out_df["Item"].astype(str) + "::" + pd.to_datetime(cash_out_df["Due Date"]).dt.strftime("%Y-%m-%d")
+    return cash_out_df
+
+@st.cache_data(show_spinner=False)
+def cached_liability_totals(data_key: tuple, _df: pd.DataFrame, windows: dict) -> dict:
+    # {card: (amount, count)} per set of cycle windows; the windows carry any saved overrides,
+    # so radio/checkbox reruns reuse the bills totals instead of re-grouping the frame.
+    # Keyed on data_key (upload + card overrides); _df is not hashed.
+    return liability_totals(_df, windows)
+
+@st.cache_data(show_spinner=False)
+def cached_expense_rows_by_card(data_key: tuple, _df: pd.DataFrame) -> dict:
+    # per-card date-sorted expense positions, built once per frame and shared by every section
+    return expense_rows_by_card(_df)
+
+@st.cache_data(show_spinner=False)
+def card_mapping_counts(data_key: tuple, _df: pd.DataFrame):
+    # (card counts, unmapped Payment mode counts); the latter is None without a Payment mode column.
+    # Keyed on data_key (upload + card overrides); _df is not hashed.
+    # one bincount over the category codes (NaN's -1 goes to a trailing slot), largest first
+    cards = pd.Categorical(_df["Card"])
+    n_cats = len(cards.categories)
+    counts = np.bincount(np.where(cards.codes < 0, n_cats, cards.codes), minlength=n_cats + 1)
+    card_counts = pd.DataFrame({"Card": [*cards.categories, np.nan], "count": counts})
+    card_counts = card_counts[card_counts["count"] > 0].sort_values("count", ascending=False, kind="stable").reset_index(drop=True)
+    if "Payment mode" not in _df.columns:
+        return card_counts, None
+    if counts[-1] == 0:  # NaN slot empty: every row is mapped, skip the Payment mode scan
+        return card_counts, pd.DataFrame(columns=["Payment mode", "count"])
+    # Count raw values first, then stringify/relabel only the unique modes
+    counts = _df.loc[cards.isna(), "Payment mode"].value_counts(dropna=False, sort=False)
+    counts = counts[counts.gt(0)]  # categorical modes also report unused categories
+    labels = counts.index.astype(str).to_series().replace({"": "(blank)", "nan": "(blank)", "None": "(blank)"})
+    unmapped = (
+        counts.groupby(labels.to_numpy(), sort=False).sum()
+          .sort_values(ascending=False, kind="stable")
+          .rename_axis("Payment mode")
+          .reset_index(name="count")
+    )
+    return card_counts, unmapped
+
+@st.cache_data(show_spinner=False)
+def csv_bytes(data_key: tuple, name: str, _df: pd.DataFrame, index: bool = False) -> bytes:
+    # Download payloads: every expander's button needs its bytes on each rerun, so serialize once.
+    # Keyed on data_key plus a name that pins down the slice (card, window, ...); _df is not hashed.
+    return _df.to_csv(index=index).encode("utf-8")
+
 def validate_dataframe(df: pd.DataFrame):
     missing = REQUIRED_COLS.difference(df.columns)
     return (len(missing) == 0, missing)
 
 @st.cache_data(show_spinner=False)
-def compute_monthly_for_trends(df: pd.DataFrame) -> pd.DataFrame:
-    tmp = df.copy()
-    tmp = tmp.loc[tmp["type"].str.lower().eq("expense")].copy()
-    tmp["YYYY-MM"] = tmp["Date"].dt.to_period("M").astype(str)
-    tmp = tmp.loc[tmp["Card"].notna()].copy()
-    g = (
-        tmp.groupby(["YYYY-MM", "Card"])["Amount"]
-        .sum()
-        .unstack(fill_value=0.0)
-        .sort_index()
+def compute_monthly_for_trends(data_key: tuple, _df: pd.DataFrame) -> pd.DataFrame:
+    # (month x card) totals: integer codes for both keys, one np.add.at into a dense matrix.
+    # Keyed on data_key (upload + card overrides); _df is not hashed.
+    tmp = _df.loc[expense_mask(_df) & _df["Card"].notna().to_numpy(), ["Date", "Card", "Amount"]]
+    period_codes, periods = pd.factorize(tmp["Date"].dt.to_period("M"), sort=True)
+    card_codes, cards = pd.factorize(tmp["Card"], sort=True)
+    totals = np.zeros((len(periods), len(cards)), dtype=np.float64)
+    np.add.at(totals, (period_codes, card_codes), tmp["Amount"].to_numpy(dtype=np.float64))
+    g = pd.DataFrame(
+        totals,
+        index=pd.Index(periods.astype(str), name="YYYY-MM"),
+        columns=pd.Index(np.asarray(cards, dtype=object), name="Card"),
     )
     return g.round(2)
+
+@st.cache_data(show_spinner=False)
+def compute_trends_table(m: pd.DataFrame, cards: tuple) -> pd.DataFrame:
+    # Monthly totals plus MoM % for the chosen cards, columns sorted; re-used while window/cards are unchanged.
+    # totals come in rounded (compute_monthly_for_trends), so only the MoM block needs it
+    mom = m[list(cards)].pct_change().mul(100.0).replace([np.inf, -np.inf], np.nan).round(2).add_suffix(" MoM %")
+    combined = pd.concat([m, mom], axis=1, copy=False)
+    return combined.reindex(columns=sorted(combined.columns))
+
+@st.cache_data(show_spinner=False)
+def trend_anomaly_styles(table: pd.DataFrame, exclude_current: bool, this_ym: str) -> pd.DataFrame:
+    # CSS for the trends Styler: per total column, median of positive months; flag values above 1.5x it
+    totals = table[[c for c in table.columns if "MoM %" not in c]]
+    ref = totals
+    if exclude_current and (len(table.index) > 0) and (table.index[-1] == this_ym):
+        ref = totals.iloc[:-1]
+    med = ref.where(ref > 0).median()
+    is_anom = totals.gt(1.5 * med.where(med > 0))  # NaN threshold (no positive months) never flags
+    css = pd.DataFrame('', index=table.index, columns=table.columns)
+    css[totals.columns] = np.where(is_anom, "background-color: #f7a5a5; font-weight: bold", "")
+    return css
@@ -2,10 +2,11 @@
 import re
 import datetime as dt
 from datetime import date
+from functools import lru_cache
 from typing import Dict, Tuple, Optional
 
+import numpy as np
 import pandas as pd
-from dateutil.relativedelta import relativedelta
 
 from config import CANON_COLS  # constants only — OK
 
@@ -43,72 +44,148 @@ CARD_REGEX = [
     (r"\bhsbc\b", "HSBC"),
 ]
 
-def detect_card(payment_mode: str, user_overrides: Optional[Dict[str, str]] = None) -> Optional[str]:
-    if not payment_mode:
-        return None
-    import streamlit as st
-    # auto mapping created via diagnostics UI
-    if payment_mode in (getattr(st.session_state, 'auto_overrides', {}) or {}):
-        return st.session_state.auto_overrides[payment_mode]
-    # user JSON overrides
-    if user_overrides and payment_mode in user_overrides:
-        return user_overrides[payment_mode]
-    text = str(payment_mode).lower()
-    for pat, name in CARD_REGEX:
-        if re.search(pat, text):
-            if name == "One" and "closed" in text:
-                return None
-            return name
-    return None
+# Single pass over a column: an alternation of anchored lookaheads, tried in CARD_REGEX
+# order, so the first matching pattern wins; m.lastgroup names the card.
+CARD_RE = re.compile(
+    "^(?:" + "|".join(f"(?=.*?{pat})(?P<c{i}>)" for i, (pat, _) in enumerate(CARD_REGEX)) + ")",
+    re.DOTALL,
+)
+_CARD_GROUPS = {f"c{i}": name for i, (_, name) in enumerate(CARD_REGEX)}
+
+def detect_cards(payment_modes: pd.Series, user_overrides: Optional[Dict[str, str]] = None,
+                 auto_overrides: Optional[Dict[str, str]] = None) -> pd.Series:
+    # modes repeat heavily; classify each distinct string once and broadcast back by code
+    codes, uniques = pd.factorize(payment_modes)
+    modes = pd.Series(uniques, dtype=object)
+    text = modes.astype(str).str.lower()
+    hits = text.str.extract(CARD_RE)[list(_CARD_GROUPS)].notna()
+    cards = hits.idxmax(axis=1).map(_CARD_GROUPS).where(hits.any(axis=1))
+    cards = cards.mask(cards.eq("One") & text.str.contains("closed", regex=False))
+    # user JSON overrides, then auto mappings from the diagnostics UI (highest priority)
+    for overrides in (user_overrides, auto_overrides):
+        if overrides:
+            # membership, not a non-null mapped value: mapping a mode to null is an explicit "unmap"
+            cards = cards.mask(modes.isin(list(overrides)), modes.map(overrides))
+    cards = cards.mask(modes.eq("")).to_numpy(dtype=object)
+    # code -1 (NaN mode) lands on the trailing NaN slot
+    return pd.Series(np.append(cards, np.nan)[codes], index=payment_modes.index, dtype=object)
 
 # -------- Dates & cycles --------
+# Integer (y, m, d) math: a month-length table plus one leap check, no calendar/relativedelta.
+_DAYS = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+def _is_leap(y: int) -> bool:
+    return y % 4 == 0 and (y % 100 != 0 or y % 400 == 0)
+
+def days_in_month(y: int, m: int) -> int:
+    return _DAYS[m - 1] + (m == 2 and _is_leap(y))
+
+def shift_ym(y: int, m: int, k: int) -> Tuple[int, int]:
+    y2, m0 = divmod(y * 12 + (m - 1) + k, 12)
+    return y2, m0 + 1
+
 def month_range(y: int, m: int):
-    start = dt.date(y, m, 1)
-    end = start + relativedelta(months=1) - dt.timedelta(days=1)
-    return start, end
+    return dt.date(y, m, 1), dt.date(y, m, days_in_month(y, m))
 
 def safe_date(year: int, month: int, day: int) -> date:
-    last_day = month_range(year, month)[1].day
-    return dt.date(year, month, min(day, last_day))
+    return dt.date(year, month, min(day, days_in_month(year, month)))
 
 def month_shift(d: date, k: int) -> date:
-    mid = dt.date(d.year, d.month, 15) + relativedelta(months=k)
-    end_day = month_range(mid.year, mid.month)[1].day
-    return dt.date(mid.year, mid.month, min(d.day, end_day))
+    y, m = shift_ym(d.year, d.month, k)
+    return safe_date(y, m, d.day)
 
 def months_back(n: int, ref_date: date):
-    end = dt.date(ref_date.year, ref_date.month, month_range(ref_date.year, ref_date.month)[1].day)
-    start = end - relativedelta(months=n) + relativedelta(days=1)
+    end = month_range(ref_date.year, ref_date.month)[1]
+    start = safe_date(*shift_ym(end.year, end.month, -n), end.day) + dt.timedelta(days=1)
     return start, end
 
+def _wall_time(d: pd.Series) -> pd.Series:
+    # offset-stamped values ("...T10:22:11+05:30") keep their local wall time, tz-naive like every compare downstream
+    return d.dt.tz_localize(None) if isinstance(d.dtype, pd.DatetimeTZDtype) else d
+
+def parse_dates(s: pd.Series) -> pd.Series:
+    # ISO fast path; only strings it rejects go through the generic (format-guessing) parser
+    out = _wall_time(pd.to_datetime(s, errors="coerce", format="ISO8601", cache=True))
+    retry = out.isna() & s.notna()
+    if retry.any():
+        out[retry] = _wall_time(pd.to_datetime(s[retry], errors="coerce", cache=True))
+    return out
+
+_NON_DIGITS = re.compile(r"[^0-9]")
+
+# Due dates for config day hints ("3rd" -> 3, blank -> 1), clamped into (y, m). The hint
+# lists are constants, so each month's answer is computed once and reused across reruns.
+@lru_cache(maxsize=256)
+def hint_due_dates(hints: tuple, y: int, m: int) -> tuple:
+    days = (
+        pd.Series(hints, dtype=object).astype(str).str.replace(_NON_DIGITS, "", regex=True)
+          .replace("", "1").astype(int).clip(1, days_in_month(y, m))
+    )
+    return tuple(dt.date(y, m, d) for d in days)
+
 def override_key(year: int, month: int, card: str) -> str:
     return f"{year:04d}-{month:02d}::{card}"
 
 def get_active_cycles(default_cycles: Dict[str, Tuple[int,int,int,int]]) -> Dict[str, Tuple[int,int,int,int]]:
     import streamlit as st
-    cycles = default_cycles.copy()
-    if getattr(st.session_state, "cycle_overrides", None):
-        cycles.update(st.session_state.cycle_overrides)
-    if getattr(st.session_state, "new_card_cycles", None):
-        cycles.update(st.session_state.new_card_cycles)
-    return cycles
+    # later sources win: defaults | per-card cycle overrides | user-added cards (one merge each)
+    return (
+        default_cycles
+        | (getattr(st.session_state, "cycle_overrides", None) or {})
+        | (getattr(st.session_state, "new_card_cycles", None) or {})
+    )
 
-def get_cycle_for_month(card: str, year: int, month: int, cycles: Dict[str, Tuple[int,int,int,int]]):
-    start_day, end_day, due_day, due_offset = cycles[card]
+@lru_cache(maxsize=64)
+def _sorted_names(names: frozenset) -> tuple:
+    return tuple(sorted(names))
+
+def sorted_cards(cycles: Dict[str, Tuple[int,int,int,int]]) -> tuple:
+    # Card order shared by every section: the cycles plus cards added this session, sorted once per set.
+    import streamlit as st
+    return _sorted_names(frozenset(cycles.keys() | st.session_state.new_card_cycles.keys()))
+
+# Pure in its (hashable) arguments and re-asked on every rerun/tab, so memoize it.
+@lru_cache(maxsize=4096)
+def _cycle_dates(start_day: int, end_day: int, due_day: int, due_offset: int, year: int, month: int):
     cycle_end = safe_date(year, month, end_day)
     start_date = safe_date(year, month, start_day)
-    cycle_start = start_date - relativedelta(months=1) if start_day > end_day else start_date
-    due_month = month + due_offset
-    due_year = year + (due_month - 1) // 12
-    due_month = (due_month - 1) % 12 + 1
-    due_dt = safe_date(due_year, due_month, due_day)
+    cycle_start = safe_date(*shift_ym(year, month, -1), start_date.day) if start_day > end_day else start_date
+    due_dt = safe_date(*shift_ym(year, month, due_offset), due_day)
     return cycle_start, cycle_end, cycle_end, due_dt
 
+def get_cycle_for_month(card: str, year: int, month: int, cycles: Dict[str, Tuple[int,int,int,int]]):
+    return _cycle_dates(*cycles[card], year, month)
+
+# Vectorized default windows: every card x month offset in one datetime64[D] sweep.
+# Returns {card: (cycle_start, cycle_end, due)} arrays indexed like `offsets`.
+def _days_in(months: np.ndarray) -> np.ndarray:
+    return ((months + 1).astype("datetime64[D]") - months.astype("datetime64[D]")).astype(np.int64)
+
+def _clamp_day(months: np.ndarray, day) -> np.ndarray:
+    days = np.minimum(day, _days_in(months)) - 1
+    return months.astype("datetime64[D]") + days.astype("timedelta64[D]")
+
+def cycle_windows(cycles: Dict[str, Tuple[int,int,int,int]], year: int, month: int, offsets=(0,)):
+    cards = list(cycles)
+    if not cards:
+        return {}
+    params = np.array([cycles[c] for c in cards], dtype=np.int64)
+    start_day, end_day, due_day, due_offset = (params[:, i:i + 1] for i in range(4))
+    base = np.datetime64(f"{year:04d}-{month:02d}", "M") + np.asarray(offsets, dtype=np.int64)
+    months = np.broadcast_to(base, (len(cards), base.size))
+    cycle_end = _clamp_day(months, end_day)
+    cycle_start = np.where(
+        start_day > end_day,
+        _clamp_day(months - 1, np.minimum(start_day, _days_in(months))),
+        _clamp_day(months, start_day),
+    )
+    due = _clamp_day(months + due_offset, due_day)
+    return {c: (cycle_start[i], cycle_end[i], due[i]) for i, c in enumerate(cards)}
+
 def get_overridden_cycle(card: str, year: int, month: int, cycles: Dict[str, Tuple[int,int,int,int]]):
     import streamlit as st
-    key = override_key(year, month, card)
-    if key in st.session_state.card_date_overrides:
-        r = st.session_state.card_date_overrides[key]
+    r = st.session_state.card_date_overrides.get(override_key(year, month, card))
+    if r is not None:
         try:
             cstart = dt.date.fromisoformat(r["start"])
             cend   = dt.date.fromisoformat(r["end"])
@@ -118,29 +195,115 @@ def get_overridden_cycle(card: str, year: int, month: int, cycles: Dict[str, Tup
             pass
     return get_cycle_for_month(card, year, month, cycles)
 
+def get_overridden_cycles(cycles: Dict[str, Tuple[int,int,int,int]], year: int, month: int):
+    # Every card's window for one month: vectorized defaults, then saved per-card overrides.
+    import streamlit as st
+    overrides = st.session_state.card_date_overrides
+    out = {}
+    for card, (starts, ends, dues) in cycle_windows(cycles, year, month).items():
+        if override_key(year, month, card) in overrides:
+            out[card] = get_overridden_cycle(card, year, month, cycles)
+        else:
+            cend = ends[0].astype(object)
+            out[card] = (starts[0].astype(object), cend, cend, dues[0].astype(object))
+    return out
+
 def find_cycle_due_in_month(card: str, target_year: int, target_month: int, cycles: Dict[str, Tuple[int,int,int,int]]):
+    import streamlit as st
+    offsets = range(-2, 3)
+    anchors = [shift_ym(target_year, target_month, k) for k in offsets]
+    overridden = [override_key(y, m, card) in st.session_state.card_date_overrides for y, m in anchors]
+    due_offset = cycles[card][3]
+    # Fast path: with no saved overrides nearby, only the cycle due_offset months back is due this month
+    if not any(overridden) and -2 <= due_offset <= 2:
+        return get_cycle_for_month(card, *shift_ym(target_year, target_month, -due_offset), cycles)
+    starts, ends, dues = cycle_windows({card: cycles[card]}, target_year, target_month, offsets)[card]
     candidates = []
-    for k in range(-2, 3):
-        anchor = dt.date(target_year, target_month, 15) + relativedelta(months=k)
-        cstart, cend, bill_dt, due_dt = get_overridden_cycle(card, anchor.year, anchor.month, cycles)
-        candidates.append((cstart, cend, bill_dt, due_dt))
+    for (ay, am), has_override, cstart, cend, due_dt in zip(
+        anchors, overridden, starts.astype(object), ends.astype(object), dues.astype(object)
+    ):
+        if has_override:
+            cstart, cend, _, due_dt = get_overridden_cycle(card, ay, am, cycles)
+        candidates.append((cstart, cend, cend, due_dt))
     for cstart, cend, bill_dt, due_dt in candidates:
         if due_dt.year == target_year and due_dt.month == target_month:
             return cstart, cend, bill_dt, due_dt
     center = dt.date(target_year, target_month, 15)
     return min(candidates, key=lambda x: abs((x[3] - center).days))
 
-def sum_liability(df: pd.DataFrame, card: str, start_dt: date, end_dt: date):
-    mask = (
-        (df["Card"] == card)
-        & (df["type"].str.lower().eq("expense"))
-        & (df["Amount"] > 0)
-        & (df["Date"].dt.date >= start_dt)
-        & (df["Date"].dt.date <= end_dt)
-    )
-    sub = df.loc[mask, ["Date", "Category", "Amount", "Note", "Payment mode", "Tags"]].copy().sort_values("Date")
-    if not sub.empty:
-        sub["Amount"] = round_series_2(sub["Amount"])
-    amount = r2(sub["Amount"].sum() if not sub.empty else 0.0)
+def find_cycles_due_in_month(cycles: Dict[str, Tuple[int,int,int,int]], cards, target_year: int, target_month: int):
+    # Batch form for the bills/cash-flow tables: overrides near the target month are collected once,
+    # cards without any take the memoized direct path, the rest go through the full scan.
+    import streamlit as st
+    prefixes = tuple(override_key(y, m, "") for y, m in (shift_ym(target_year, target_month, k) for k in range(-2, 3)))
+    near = {k.split("::", 1)[1] for k in st.session_state.card_date_overrides if k.startswith(prefixes)}
+    out = {}
+    for card in cards:
+        due_offset = cycles[card][3]
+        if card not in near and -2 <= due_offset <= 2:
+            out[card] = get_cycle_for_month(card, *shift_ym(target_year, target_month, -due_offset), cycles)
+        else:
+            out[card] = find_cycle_due_in_month(card, target_year, target_month, cycles)
+    return out
+
+# -------- Liabilities --------
+LIABILITY_COLS = ["Date", "Category", "Amount", "Note", "Payment mode", "Tags"]
+_NO_ROWS = np.empty(0, dtype=np.intp)
+_NO_DATES = np.empty(0, dtype="datetime64[ns]")
+
+def expense_mask(df: pd.DataFrame) -> np.ndarray:
+    # app.py stores the lowercased type check once per upload as `_is_expense`.
+    if "_is_expense" in df.columns:
+        return df["_is_expense"].to_numpy()
+    return df["type"].str.lower().eq("expense").to_numpy()
+
+def expense_rows_by_card(df: pd.DataFrame) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    # Per card: positive-amount expense row positions sorted by Date, plus their sorted dates
+    # (build once per section; windows are then answered with searchsorted).
+    is_expense = expense_mask(df) & (df["Amount"].to_numpy() > 0)
+    rows = np.flatnonzero(is_expense)
+    dates = df["Date"].to_numpy()
+    groups = df.iloc[rows].groupby("Card", observed=True, sort=False).indices
+    out = {}
+    for card, pos in groups.items():
+        card_rows = rows[pos]
+        order = np.argsort(dates[card_rows], kind="stable")
+        card_rows = np.ascontiguousarray(card_rows[order])
+        out[card] = (card_rows, np.ascontiguousarray(dates[card_rows]))
+    return out
+
+def card_window_rows(df: pd.DataFrame, card: str, start_dt: date, end_dt: date,
+                     rows_by_card: Dict[str, Tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+    # Inclusive [start_dt, end_dt]: two binary searches on the card's sorted dates, one slice.
+    rows, dates = rows_by_card.get(card, (_NO_ROWS, _NO_DATES))
+    lo = np.searchsorted(dates, np.datetime64(start_dt).astype(dates.dtype), side="left")
+    hi = np.searchsorted(dates, (np.datetime64(end_dt) + np.timedelta64(1, "D")).astype(dates.dtype), side="left")
+    return rows[lo:hi]
+
+def liability_totals(df: pd.DataFrame, windows: Dict[str, Tuple[date, date]]) -> Dict[str, Tuple[float, int]]:
+    # All cards in one pass: attach each expense row's card window by code, filter, group once.
+    is_expense = expense_mask(df) & (df["Amount"].to_numpy() > 0)
+    exp = df.loc[is_expense, ["Card", "Date", "Amount"]]
+    codes, uniques = pd.factorize(exp["Card"])
+    bounds = pd.DataFrame.from_dict(windows, orient="index", columns=["start", "end"]).reindex(uniques)
+    starts = np.append(pd.to_datetime(bounds["start"]).to_numpy(), np.datetime64("NaT"))
+    ends = np.append(pd.to_datetime(bounds["end"]).to_numpy(), np.datetime64("NaT")) + np.timedelta64(1, "D")
+    dates = exp["Date"].to_numpy()
+    inside = (dates >= starts[codes]) & (dates < ends[codes])  # code -1 (unmapped) hits the NaT slot
+    g = exp.loc[inside].groupby("Card", observed=True)["Amount"].agg(["sum", "size"])
+    return {
+        card: ((r2(g.at[card, "sum"]), int(g.at[card, "size"])) if card in g.index else (0.0, 0))
+        for card in windows
+    }
+
+def sum_liability(df: pd.DataFrame, card: str, start_dt: date, end_dt: date,
+                  rows_by_card: Dict[str, Tuple[np.ndarray, np.ndarray]]):
+    rows = card_window_rows(df, card, start_dt, end_dt, rows_by_card)
+    if rows.size == 0:
+        # card with no transactions (or none in this window): skip the take/round/sum
+        return df.iloc[:0][LIABILITY_COLS], 0.0, 0
+    sub = df.iloc[rows][LIABILITY_COLS]  # rows come back date-ordered; no re-sort
+    sub["Amount"] = round_series_2(sub["Amount"])
+    amount = r2(sub["Amount"].sum())
     txn_count = int(sub.shape[0])
     return sub, amount, txn_count
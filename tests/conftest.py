@@ -0,0 +1,6 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+# the app modules live at the repo root (no package), so make them importable from tests/
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
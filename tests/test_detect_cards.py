@@ -0,0 +1,17 @@
+# tests/test_detect_cards.py
+import pandas as pd
+
+from helpers import detect_cards
+
+MODES = pd.Series(["3. May Amex", "ICICI Amazon", "3. May Amex", None, ""])
+
+def test_regex_labels():
+    assert detect_cards(MODES).tolist()[:3] == ["Amex", "ICICI", "Amex"]
+
+def test_null_override_unmaps():
+    cards = detect_cards(MODES, {"3. May Amex": None})
+    assert cards.isna().tolist() == [True, False, True, True, True]
+
+def test_auto_overrides_win_over_user():
+    cards = detect_cards(MODES, {"ICICI Amazon": "Amex"}, {"ICICI Amazon": "SBI"})
+    assert cards.iat[1] == "SBI"
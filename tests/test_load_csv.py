@@ -0,0 +1,30 @@
+# tests/test_load_csv.py
+from datetime import date
+
+import pandas as pd
+
+from data import load_csv
+from helpers import liability_totals
+
+OFFSET_CSV = b"""Date,Category,Amount,Note,type,Payment mode,To payment mode,Tags
+2026-03-13T10:22:11+05:30,Food,120.50,Lunch,Expense,Amex Platinum,,
+2026-03-14T00:10:00+05:30,Bills,80.00,Power,Expense,Amex Platinum,,
+2026-03-20T18:45:00+05:30,Salary,5000.00,Pay,Income,HDFC Bank,,
+"""
+
+def test_offset_dates_load_tz_naive():
+    df = load_csv(OFFSET_CSV)
+    assert df["Date"].dt.tz is None
+    assert df["Date"].notna().all()
+
+def test_offset_dates_keep_local_day():
+    df = load_csv(OFFSET_CSV)
+    assert df["Date"].dtype == "datetime64[ns]"
+    # just after local midnight: must not slide back to the previous (UTC) day
+    assert df["Date"].dt.date.tolist() == [date(2026, 3, 13), date(2026, 3, 14), date(2026, 3, 20)]
+
+def test_offset_dates_aggregate_by_card_window():
+    df = load_csv(OFFSET_CSV)
+    df["Card"] = "Amex"
+    totals = liability_totals(df, {"Amex": (date(2026, 2, 22), date(2026, 3, 21))})
+    assert totals["Amex"] == (200.5, 2)
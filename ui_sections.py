@@ -1,66 +1,68 @@
 # ui_sections.py
 import re
 import json
-import io
 import numpy as np
 import pandas as pd
 import streamlit as st
 import datetime as dt
 from datetime import date
+from functools import lru_cache
 
 from helpers import (
-    month_shift, months_back, override_key, get_active_cycles, detect_card,
-    get_overridden_cycle, get_cycle_for_month, find_cycle_due_in_month, sum_liability,
+    month_shift, months_back, safe_date, override_key,
+    get_overridden_cycle, find_cycles_due_in_month, sum_liability,
+    card_window_rows, expense_mask, get_overridden_cycles, sorted_cards,
+)
+from data import (
+    items_frame, cash_out_frame, compute_trends_table, trend_anomaly_styles, cached_liability_totals, cached_expense_rows_by_card,
+    card_mapping_counts, csv_bytes, debt_summary,
 )
 
 # ---------- Diagnostics ----------
-def diagnostics_section(df: pd.DataFrame, BILL_CYCLES):
+BANK_HINTS = {
+    "axis": "Axis", "hdfc": "HDFC", "kotak": "Kotak", "icici": "ICICI",
+    "sbi": "SBI", "hdfc bank": "HDFC", "bob": "BOB", "idfc": "IDFC",
+    "yes": "Yes", "rbl": "RBL", "amex": "Amex", "hsbc": "HSBC", "onecard": "One"
+}
+# first BANK_HINTS key contained in the mode wins (dict order, same lookahead trick as CARD_RE);
+# otherwise the mode's leading alphanumeric token, title-cased
+_HINT_RE = re.compile("^(?:" + "|".join(f"(?=.*?{re.escape(k)})(?P<h{i}>)" for i, k in enumerate(BANK_HINTS)) + ")", re.DOTALL)
+_HINT_GROUPS = {f"h{i}": v for i, v in enumerate(BANK_HINTS.values())}
+
+@lru_cache(maxsize=64)
+def suggest_cards(modes: tuple) -> tuple:
+    # memoized on the unmapped set, so widget reruns skip the regex pass
+    low = pd.Series(modes, dtype=object).astype(str).str.lower()
+    hits = low.str.extract(_HINT_RE)[list(_HINT_GROUPS)].notna()
+    token = low.str.strip().str.extract(r"^([a-z0-9]*)", expand=False).replace("", "Card").str.title()
+    return tuple(hits.idxmax(axis=1).map(_HINT_GROUPS).where(hits.any(axis=1), token))
+
+def diagnostics_section(df: pd.DataFrame, data_key, BILL_CYCLES):
     with st.expander("🔍 Detector diagnostics (Card mapping)", expanded=False):
         st.markdown("**Mapped Card counts**")
-        st.dataframe(
-            df["Card"].value_counts(dropna=False).rename_axis("Card").reset_index(name="count"),
-            use_container_width=True
-        )
+        card_counts, unmapped = card_mapping_counts(data_key, df)  # cached per upload/mapping, not per widget rerun
+        st.dataframe(card_counts, use_container_width=True)
 
         st.markdown("**Unmapped Payment modes**")
-        if "Payment mode" not in df.columns:
+        if unmapped is None:
             st.warning("Column 'Payment mode' not found after normalization.")
             unmapped = pd.DataFrame(columns=["Payment mode", "count"])
-        else:
-            unmapped = (
-                df.loc[df["Card"].isna(), "Payment mode"]
-                  .astype(str)
-                  .replace({"": "(blank)", "nan": "(blank)", "None": "(blank)"})
-                  .rename_axis("Payment mode")
-                  .value_counts()
-                  .reset_index(name="count")
-            )
 
         if unmapped.empty:
             st.success("All Payment modes are mapped to cards.")
             return
 
-        BANK_HINTS = {
-            "axis": "Axis", "hdfc": "HDFC", "kotak": "Kotak", "icici": "ICICI",
-            "sbi": "SBI", "hdfc bank": "HDFC", "bob": "BOB", "idfc": "IDFC",
-            "yes": "Yes", "rbl": "RBL", "amex": "Amex", "hsbc": "HSBC", "onecard": "One"
-        }
-        def suggest(name: str) -> str:
-            low = str(name).lower()
-            for k, v in BANK_HINTS.items():
-                if k in low:
-                    return v if v in ["Amex","HSBC","One","ICICI","SBI"] else f"{v}"
-            token = re.split(r"[^a-z0-9]+", low.strip())[0] or "Card"
-            return token.title()
-
-        unmapped["Suggested Card"] = unmapped["Payment mode"].apply(suggest)
-        st.dataframe(unmapped.head(20), use_container_width=True, hide_index=True)
+        preview = unmapped.head(20)  # only these rows are shown, so only these need a suggestion
+        st.dataframe(
+            preview.assign(**{"Suggested Card": suggest_cards(tuple(preview["Payment mode"]))}),
+            use_container_width=True, hide_index=True,
+        )
 
         st.markdown("---")
         st.markdown("### ⚡ Quick add mapping")
         with st.form("add_new_card_form", clear_on_submit=False):
             pm_choice = st.selectbox("Choose a Payment mode string to map", options=list(unmapped["Payment mode"]), index=0)
-            sugg = suggest(pm_choice)
+            sugg = suggest_cards((pm_choice,))[0]
             new_card_name = st.text_input("New card name", value=sugg)
             st.caption("Define default cycle days for this new card (can be changed later).")
             c1, c2, c3, c4 = st.columns(4)
@@ -122,9 +124,8 @@ def start_balance_override_section(start_balance_sb: float, extra_buffer_sb: flo
 # ---------- Debt summary ----------
 def debt_summary_section(DEBTS):
     st.subheader("🏦 Long-Term Debt & EMI Summary")
-    debt_df = pd.DataFrame(DEBTS)
-    total_outstanding_tracked = debt_df[debt_df["tenure_left"].apply(lambda x: isinstance(x, int))]["outstanding"].sum()
-    total_emi = float(debt_df["amount"].sum())
+    debt_df = items_frame(DEBTS)
+    total_outstanding_tracked, total_emi = debt_summary(DEBTS)
     st.markdown(f"**Total Monthly EMI Outflow: ₹{total_emi:,.2f}**")
     st.markdown(f"**Total Tracked Outstanding (Excl. Home Loan): ₹{total_outstanding_tracked:,.2f}**")
     st.dataframe(
@@ -133,72 +134,50 @@ def debt_summary_section(DEBTS):
     )
 
 # ---------- Per-card custom dates + month anchor ----------
-def per_card_dates_editor_section(BILL_CYCLES, today: date):
-    st.markdown("---")
-    st.header("💳 Bills (choose your perspective)")
-    sel_col1, sel_col2 = st.columns([1.2, 2])
-    with sel_col1:
-        bills_view = st.radio(
-            "Month View (for this section)",
-            options=["Previous", "Current", "Next", "Custom"],
-            horizontal=True,
-            index=1,
-        )
-    with sel_col2:
-        st.caption("This changes the **month** for both tabs and the quick selector.")
-
-    if bills_view == "Previous":
-        bills_anchor = month_shift(today, -1)
-    elif bills_view == "Next":
-        bills_anchor = month_shift(today, +1)
-    elif bills_view == "Custom":
-        bills_anchor = st.date_input("Pick any date in the target month (Bills section only)", value=today, key="bills_anchor_custom")
-    else:
-        bills_anchor = today
-    by_y, by_m = bills_anchor.year, bills_anchor.month
-
-    # Per-card custom dates editor
-    st.subheader(f"🗓 Per-card custom dates for {bills_anchor.strftime('%b %Y')}")
+# Grid edits only stage until Save and rerun just the enclosing bills fragment; Save/Clear/Import
+# change the overrides every bills view reads and therefore rerun the whole app. Not a fragment of
+# its own: by_y/by_m must follow the bills month chosen in the same run.
+def _card_dates_editor(BILL_CYCLES, by_y: int, by_m: int):
     with st.expander("Edit custom dates (optional) — overrides apply only to this month", expanded=False):
-        edited_records = {}
-        for card in sorted(BILL_CYCLES.keys() | st.session_state.new_card_cycles.keys()):
-            cstart_d, cend_d, bill_d, due_d = get_overridden_cycle(card, by_y, by_m, BILL_CYCLES)
-            key = override_key(by_y, by_m, card)
-            if key in st.session_state.card_date_overrides:
-                rec = st.session_state.card_date_overrides[key]
-                try:
-                    cstart_d = dt.date.fromisoformat(rec["start"])
-                    cend_d   = dt.date.fromisoformat(rec["end"])
-                    due_d    = dt.date.fromisoformat(rec["due"])
-                except Exception:
-                    pass
-            c1, c2, c3 = st.columns(3)
-            st.markdown(f"**{card}**")
-            start_inp = c1.date_input(f"{card} — Cycle Start", value=cstart_d, key=f"ov_{key}_start")
-            end_inp   = c2.date_input(f"{card} — Cycle End (bill gen)", value=cend_d, key=f"ov_{key}_end")
-            due_inp   = c3.date_input(f"{card} — Due Date", value=due_d, key=f"ov_{key}_due")
-            if start_inp > end_inp:
-                st.warning(f"{card}: Start after End; will swap on save.")
-            edited_records[key] = {"start": start_inp.isoformat(), "end": end_inp.isoformat(), "due": due_inp.isoformat()}
+        # one editable grid (a row per card) instead of three date inputs per card;
+        # get_overridden_cycles already applies this month's saved overrides
+        cards = sorted_cards(BILL_CYCLES)
+        windows = get_overridden_cycles(BILL_CYCLES, by_y, by_m)
+        date_cols = ["Cycle Start", "Cycle End (bill gen)", "Due Date"]
+        grid = pd.DataFrame(
+            [(card, windows[card][0], windows[card][1], windows[card][3]) for card in cards],
+            columns=["Card", *date_cols],
+        )
+        edited = st.data_editor(
+            grid, key=f"ov_grid_{by_y}_{by_m}", hide_index=True, use_container_width=True,
+            disabled=["Card"], num_rows="fixed",
+            column_config={c: st.column_config.DateColumn(c, required=True) for c in date_cols},
+        )
+        starts, ends, dues = (pd.to_datetime(edited[c]).dt.date for c in date_cols)
+        for card in edited["Card"][(starts > ends).to_numpy()]:
+            st.warning(f"{card}: Start after End; will swap on save.")
+        # this month's saved overrides: one prefix scan, shared by Clear and Export
+        prefix = f"{by_y:04d}-{by_m:02d}::"
+        this_month = {k: v for k, v in st.session_state.card_date_overrides.items() if k.startswith(prefix)}
         e1, e2, e3 = st.columns([1,1,2])
         with e1:
             if st.button("Save month overrides", use_container_width=True):
+                # ISO strings are only needed when saving, so build them here rather than every rerun
                 fixed = {}
-                for k, rec in edited_records.items():
-                    s = dt.date.fromisoformat(rec["start"]); e = dt.date.fromisoformat(rec["end"])
+                for card, s, e, d in zip(edited["Card"], starts, ends, dues):
                     if s > e: s, e = e, s
-                    fixed[k] = {"start": s.isoformat(), "end": e.isoformat(), "due": rec["due"]}
+                    fixed[override_key(by_y, by_m, card)] = {"start": s.isoformat(), "end": e.isoformat(), "due": d.isoformat()}
                 st.session_state.card_date_overrides.update(fixed)
-                st.success("Saved per-card custom dates for this month.")
+                st.toast("Saved per-card custom dates for this month.")
+                st.rerun()
         with e2:
             if st.button("Clear overrides for this month", use_container_width=True):
-                to_del = [k for k in st.session_state.card_date_overrides if k.startswith(f"{by_y:04d}-{by_m:02d}::")]
-                for k in to_del: del st.session_state.card_date_overrides[k]
-                st.success("Cleared overrides for this month.")
+                for k in this_month: del st.session_state.card_date_overrides[k]
+                st.toast("Cleared overrides for this month.")
+                st.rerun()
         with e3:
             cexp2, cimp2 = st.columns(2)
             with cexp2:
-                this_month = {k: v for k, v in st.session_state.card_date_overrides.items() if k.startswith(f"{by_y:04d}-{by_m:02d}::")}
                 st.download_button(
                     "Export this month JSON",
                     data=json.dumps(this_month, indent=2),
@@ -212,75 +191,107 @@ def per_card_dates_editor_section(BILL_CYCLES, today: date):
                     try:
                         data = json.load(up2)
                         if isinstance(data, dict):
-                            valid = {k: v for k, v in data.items() if k.startswith(f"{by_y:04d}-{by_m:02d}::")}
-                            for k, rec in list(valid.items()):
-                                if not isinstance(rec, dict) or not all(x in rec for x in ("start","end","due")):
-                                    del valid[k]
-                            st.session_state.card_date_overrides.update(valid)
+                            valid = {
+                                k: rec for k, rec in data.items()
+                                if k.startswith(prefix) and isinstance(rec, dict) and all(x in rec for x in ("start","end","due"))
+                            }
+                            # the uploader keeps its file across reruns: only re-run the app on a real change
+                            if any(st.session_state.card_date_overrides.get(k) != v for k, v in valid.items()):
+                                st.session_state.card_date_overrides.update(valid)
+                                st.toast("Imported per-card dates for this month.")
+                                st.rerun()
                             st.success("Imported per-card dates for this month.")
                         else:
                             st.warning("Invalid JSON: expecting { 'YYYY-MM::Card': {start,end,due} }")
                     except Exception as e:
                         st.error(f"Failed to import: {e}")
 
+def per_card_dates_editor_section(BILL_CYCLES, today: date):
+    st.markdown("---")
+    st.header("💳 Bills (choose your perspective)")
+    sel_col1, sel_col2 = st.columns([1.2, 2])
+    with sel_col1:
+        bills_view = st.radio(
+            "Month View (for this section)",
+            options=["Previous", "Current", "Next", "Custom"],
+            horizontal=True,
+            index=1,
+        )
+    with sel_col2:
+        st.caption("This changes the **month** for both tabs and the quick selector.")
+
+    if bills_view == "Previous":
+        bills_anchor = month_shift(today, -1)
+    elif bills_view == "Next":
+        bills_anchor = month_shift(today, +1)
+    elif bills_view == "Custom":
+        bills_anchor = st.date_input("Pick any date in the target month (Bills section only)", value=today, key="bills_anchor_custom")
+    else:
+        bills_anchor = today
+    by_y, by_m = bills_anchor.year, bills_anchor.month
+
+    # Per-card custom dates editor
+    st.subheader(f"🗓 Per-card custom dates for {bills_anchor.strftime('%b %Y')}")
+    _card_dates_editor(BILL_CYCLES, by_y, by_m)
+
     return bills_anchor, by_y, by_m
 
 # ---------- Bills tabs ----------
-def bills_tabs_section(df, BILL_CYCLES, bills_anchor, by_y, by_m):
-    import pandas as pd
+def bills_tabs_section(df, data_key, BILL_CYCLES, bills_anchor, by_y, by_m):
     tab_gen, tab_due = st.tabs(["Bills Generating in Selected Month", "Bills Due in Selected Month"])
+    cards = sorted_cards(BILL_CYCLES)
+    soon = (bills_anchor, bills_anchor + dt.timedelta(days=1))
 
     with tab_gen:
-        rows_gen, per_card_gen = [], {}
-        for card in sorted(BILL_CYCLES.keys() | st.session_state.new_card_cycles.keys()):
-            cstart, cend, bill_dt, due_dt = get_overridden_cycle(card, by_y, by_m, BILL_CYCLES)
-            sub, amount, txn_count = sum_liability(df, card, cstart, cend)
-            per_card_gen[card] = {"window": (cstart, cend, bill_dt, due_dt), "df": sub, "amount": amount, "count": txn_count}
-            rows_gen.append({
-                "Card": card, "Cycle Start": cstart, "Cycle End (Bill Gen)": cend,
-                "Due Date": due_dt, "Transactions": txn_count, "Cycle Liability (₹)": round(amount, 2)
-            })
-        card_gen_df = pd.DataFrame(rows_gen).sort_values(by="Due Date")
-        def style_bill_gen(date_col):
-            is_today_or_tomorrow = (date_col == bills_anchor) | (date_col == (bills_anchor + dt.timedelta(days=1)))
-            return ['background-color: #fff3b0; font-weight: bold' if v else '' for v in is_today_or_tomorrow]
+        gen_windows = get_overridden_cycles(BILL_CYCLES, by_y, by_m)
+        gen_totals = cached_liability_totals(data_key, df, {card: gen_windows[card][:2] for card in cards})
+        # cards ordered by due date up front, then the table is built column-wise (no row dicts, no re-sort)
+        order = sorted(cards, key=lambda c: gen_windows[c][3])
+        card_gen_df = pd.DataFrame({
+            "Card": order,
+            "Cycle Start": [gen_windows[c][0] for c in order],
+            "Cycle End (Bill Gen)": [gen_windows[c][1] for c in order],
+            "Due Date": [gen_windows[c][3] for c in order],
+            "Transactions": [gen_totals[c][1] for c in order],
+            "Cycle Liability (₹)": [round(gen_totals[c][0], 2) for c in order],
+        })
+        # bill generating on the anchor day or the next: a marker column instead of a Styler highlight
+        card_gen_df["📌"] = np.where(card_gen_df["Cycle End (Bill Gen)"].isin(soon), "📌", "")
         st.caption(f"Cycles whose **bill is generated** in **{bills_anchor.strftime('%b %Y')}**.")
         st.dataframe(
-            card_gen_df.style.apply(style_bill_gen, subset=["Cycle End (Bill Gen)"]).format({
-                "Cycle Liability (₹)": "₹{:,.2f}"
-            }),
-            use_container_width=True, hide_index=True
+            card_gen_df, use_container_width=True, hide_index=True,
+            column_config={"Cycle Liability (₹)": st.column_config.NumberColumn(format="₹%.2f")},
         )
 
     with tab_due:
-        rows_due, per_card_due, total_due_sel_month = [], {}, 0.0
-        for card in sorted(BILL_CYCLES.keys() | st.session_state.new_card_cycles.keys()):
-            cstart, cend, bill_dt, due_dt = find_cycle_due_in_month(card, by_y, by_m, BILL_CYCLES)
-            sub, amount, txn_count = sum_liability(df, card, cstart, cend)
-            per_card_due[card] = {"window": (cstart, cend, bill_dt, due_dt), "df": sub, "amount": amount, "count": txn_count}
+        due_windows = find_cycles_due_in_month(BILL_CYCLES, cards, by_y, by_m)
+        due_totals = cached_liability_totals(data_key, df, {card: due_windows[card][:2] for card in cards})
+        total_due_sel_month = 0.0
+        for card in cards:
+            due_dt = due_windows[card][3]
             if (due_dt.month == by_m) and (due_dt.year == by_y):
-                total_due_sel_month += amount
-            rows_due.append({
-                "Card": card, "Cycle Start": cstart, "Cycle End (Bill Gen)": cend,
-                "Due Date": due_dt, "Transactions": txn_count, "Payable (₹)": round(amount, 2)
-            })
-        card_due_df = pd.DataFrame(rows_due).sort_values(by="Due Date")
-        def style_due(date_col):
-            is_today_or_tomorrow = (date_col == bills_anchor) | (date_col == (bills_anchor + dt.timedelta(days=1)))
-            return ['background-color: #fff3b0; font-weight: bold' if v else '' for v in is_today_or_tomorrow]
+                total_due_sel_month += due_totals[card][0]
+        order = sorted(cards, key=lambda c: due_windows[c][3])
+        card_due_df = pd.DataFrame({
+            "Card": order,
+            "Cycle Start": [due_windows[c][0] for c in order],
+            "Cycle End (Bill Gen)": [due_windows[c][1] for c in order],
+            "Due Date": [due_windows[c][3] for c in order],
+            "Transactions": [due_totals[c][1] for c in order],
+            "Payable (₹)": [round(due_totals[c][0], 2) for c in order],
+        })
+        card_due_df["📌"] = np.where(card_due_df["Due Date"].isin(soon), "📌", "")
         st.markdown(f"**Total CC Cash-Out in {bills_anchor.strftime('%b %Y')}: ₹{total_due_sel_month:,.2f}**")
         st.caption(f"Cycles whose **due date** falls in **{bills_anchor.strftime('%b %Y')}** (true cash-out).")
         st.dataframe(
-            card_due_df.style.apply(style_due, subset=["Due Date"]).format({
-                "Payable (₹)": "₹{:,.2f}"
-            }),
-            use_container_width=True, hide_index=True
+            card_due_df, use_container_width=True, hide_index=True,
+            column_config={"Payable (₹)": st.column_config.NumberColumn(format="₹%.2f")},
         )
 
     return card_gen_df, card_due_df
 
 # ---------- Quick due selector ----------
-def quick_due_selector_section(df, BILL_CYCLES, bills_anchor):
+def quick_due_selector_section(df, data_key, BILL_CYCLES, bills_anchor):
     st.markdown("---")
     st.subheader("📅 Due-Month Quick Selector (Prev / Current / Next)")
 
@@ -300,92 +311,84 @@ def quick_due_selector_section(df, BILL_CYCLES, bills_anchor):
     else:
         due_anchor = bills_anchor
 
-    rows_quick, total_due_sel_month = [], 0.0
-    for card in sorted(BILL_CYCLES.keys() | st.session_state.new_card_cycles.keys()):
-        cstart, cend, bill_dt, due_dt = find_cycle_due_in_month(card, due_anchor.year, due_anchor.month, BILL_CYCLES)
-        mask = (
-            (df["Card"] == card)
-            & (df["type"].str.lower().eq("expense"))
-            & (df["Amount"] > 0)
-            & (df["Date"].dt.date >= cstart)
-            & (df["Date"].dt.date <= cend)
-        )
-        payable = float(df.loc[mask, "Amount"].sum())
+    total_due_sel_month = 0.0
+    rows_by_card = cached_expense_rows_by_card(data_key, df)
+    amounts = df["Amount"].to_numpy()
+    cards = sorted_cards(BILL_CYCLES)
+    due_windows = find_cycles_due_in_month(BILL_CYCLES, cards, due_anchor.year, due_anchor.month)
+    payable = {}
+    for card in cards:
+        cstart, cend, bill_dt, due_dt = due_windows[card]
+        payable[card] = float(amounts[card_window_rows(df, card, cstart, cend, rows_by_card)].sum())
         if (due_dt.month == due_anchor.month) and (due_dt.year == due_anchor.year):
-            total_due_sel_month += payable
-        rows_quick.append({
-            "Card": card, "Cycle Start": cstart, "Cycle End (Bill Gen)": cend,
-            "Due Date": due_dt, "Payable (₹)": round(payable, 2)
-        })
-    quick_df = pd.DataFrame(rows_quick).sort_values(by="Due Date")
-    def _style_due_sel(dt_col):
-        is_sel = (dt_col.apply(lambda d: d.month == due_anchor.month and d.year == due_anchor.year))
-        return ['background-color: #fff3b0; font-weight: bold' if v else '' for v in is_sel]
+            total_due_sel_month += payable[card]
+    # column-wise, like the bills tabs: cards ordered by due date up front instead of sort_values
+    order = sorted(cards, key=lambda c: due_windows[c][3])
+    quick_df = pd.DataFrame({
+        "Card": order,
+        "Cycle Start": [due_windows[c][0] for c in order],
+        "Cycle End (Bill Gen)": [due_windows[c][1] for c in order],
+        "Due Date": [due_windows[c][3] for c in order],
+        "Payable (₹)": [round(payable[c], 2) for c in order],
+    })
+    # due in the selected month: a marker column instead of a Styler highlight
+    quick_df["📌"] = [
+        "📌" if (due_windows[c][3].year, due_windows[c][3].month) == (due_anchor.year, due_anchor.month) else ""
+        for c in order
+    ]
     st.markdown(
         f"**Total CC Cash-Out in {due_anchor.strftime('%b %Y')}: ₹{total_due_sel_month:,.2f}**  "
         f"| **View:** {due_view} (base: {bills_anchor.strftime('%b %Y')})"
     )
     st.dataframe(
-        quick_df.style.apply(_style_due_sel, subset=["Due Date"]).format({
-            "Payable (₹)": "₹{:,.2f}"
-        }),
-        use_container_width=True, hide_index=True
+        quick_df, use_container_width=True, hide_index=True,
+        column_config={"Payable (₹)": st.column_config.NumberColumn(format="₹%.2f")},
     )
 
+# ---------- Bills (month view + tabs + quick selector) ----------
+# The bills month/due-view radios only feed these three blocks, so they rerun as one fragment
+# instead of the whole app; saving/clearing overrides still triggers a full app rerun.
+# Fragment reruns replay the arguments of the latest full run (streamlit >= 1.38 re-registers
+# the fragment each run), so a new upload, override or sidebar month is always picked up.
+@st.fragment
+def bills_section(df, data_key, BILL_CYCLES, today: date):
+    bills_anchor, by_y, by_m = per_card_dates_editor_section(BILL_CYCLES, today)
+    bills_tabs_section(df, data_key, BILL_CYCLES, bills_anchor, by_y, by_m)
+    quick_due_selector_section(df, data_key, BILL_CYCLES, bills_anchor)
+
 # ---------- Regulars & Paid toggles ----------
 def regulars_section(today: date, DEBTS, REGULARS):
     st.markdown("---")
     st.subheader("🗓️ Regular Expenses (incl. SIPs & Rent) — Toggle Paid")
 
-    def month_range(y, m):
-        import datetime as dt2
-        from dateutil.relativedelta import relativedelta
-        start = dt2.date(y, m, 1)
-        end = start + relativedelta(months=1) - dt2.timedelta(days=1)
-        return start, end
-
-    def due_in_month(d_hint: str, y: int, m: int) -> date:
-        import re, datetime as dt2
-        d = int(re.sub(r"[^0-9]", "", d_hint) or "1")
-        return dt2.date(y, m, min(d, month_range(y, m)[1].day))
-
     y, m = today.year, today.month
-    all_cash_outs = []
-    for r in REGULARS:
-        all_cash_outs.append({
-            "Item": r["item"], "Amount (₹)": round(float(r["amount"]), 2),
-            "Due Date": due_in_month(r["date_hint"], y, m), "Type": "Regular"
-        })
-    for d in DEBTS:
-        dday = int(re.sub(r"[^0-9]", "", str(d["due_day"])) or "1")
-        all_cash_outs.append({
-            "Item": d["item"], "Amount (₹)": round(float(d["amount"]), 2),
-            "Due Date": date(y, m, min(dday, month_range(y, m)[1].day)), "Type": d["type"]
-        })
-    cash_out_df = pd.DataFrame(all_cash_outs).sort_values(by="Due Date")
-    cash_out_df["Key"] = cash_out_df.apply(lambda r: f"CASH::{r['Item']}::{r['Due Date'].isoformat()}", axis=1)
+    cash_out_df = cash_out_frame(REGULARS, DEBTS, y, m)
     if "paid_flags" not in st.session_state:
         st.session_state.paid_flags = {}
-    cash_out_df["Paid"] = cash_out_df["Key"].map(lambda k: st.session_state.paid_flags.get(k, False))
-
-    cols = st.columns([3, 2, 2, 1])
-    cols[0].markdown("**Item (Type)**")
-    cols[1].markdown("**Amount (₹)**")
-    cols[2].markdown("**Due Date**")
-    cols[3].markdown("**Paid?**")
-    for _, row in cash_out_df.iterrows():
-        c1, c2, c3, c4 = st.columns([3, 2, 2, 1])
-        with c1: st.markdown(f"**{row['Item']}** ({row['Type']})")
-        with c2: st.markdown(f"₹{float(row['Amount (₹)']):,.2f}")
-        with c3: st.markdown(f"{row['Due Date'].strftime('%b %d, %Y')}")
-        with c4:
-            st.session_state.paid_flags[row["Key"]] = st.checkbox("", value=row["Paid"], key=row["Key"], label_visibility="collapsed")
-
-    cash_out_df["Paid"] = cash_out_df["Key"].map(lambda k: st.session_state.paid_flags.get(k, False))
+    paid_flags = st.session_state.paid_flags
+    cash_out_df["Paid"] = [paid_flags.get(k, False) for k in cash_out_df["Key"]]
+
+    # one editable grid with a Paid checkbox column instead of a row of widgets per item;
+    # inside a form, so ticking several items costs one rerun (on save) instead of one per tick
+    with st.form(f"paid_form_{y}_{m}", border=False):
+        st.caption("Paid ticks are staged: changes apply (and the cash-flow balance updates) on **💾 Save Paid Flags**.")
+        edited = st.data_editor(
+            cash_out_df[["Item", "Type", "Amount (₹)", "Due Date", "Paid"]],
+            key=f"paid_grid_{y}_{m}", hide_index=True, use_container_width=True, num_rows="fixed",
+            disabled=["Item", "Type", "Amount (₹)", "Due Date"],
+            column_config={
+                "Amount (₹)": st.column_config.NumberColumn(format="₹%.2f"),
+                "Due Date": st.column_config.DateColumn(format="MMM DD, YYYY"),
+                "Paid": st.column_config.CheckboxColumn("Paid?"),
+            },
+        )
+        st.form_submit_button("💾 Save Paid Flags")
+    cash_out_df["Paid"] = edited["Paid"].fillna(False).to_numpy(dtype=bool)
+    paid_flags.update(zip(cash_out_df["Key"], cash_out_df["Paid"].tolist()))
     return cash_out_df
 
 # ---------- Cash flow ----------
-def cashflow_section(df, BILL_CYCLES, today, salary_amount, salary_payday, cash_out_df, start_balance, extra_buffer):
+def cashflow_section(df, data_key, BILL_CYCLES, today, salary_amount, salary_payday, cash_out_df, start_balance, extra_buffer):
     st.subheader("💰 Cash Flow Simulator (by date) — Due-month view (sidebar month)")
 
     balance = round(float(start_balance) + float(extra_buffer), 2)
@@ -393,9 +396,7 @@ def cashflow_section(df, BILL_CYCLES, today, salary_amount, salary_payday, cash_
 
     # INCOME: salary
     if salary_amount and salary_amount > 0:
-        from helpers import month_range
-        s_day = min(int(salary_payday), month_range(today.year, today.month)[1].day)
-        s_date = dt.date(today.year, today.month, s_day)
+        s_date = safe_date(today.year, today.month, int(salary_payday))
         events.append({"Date": s_date, "Event": "Salary", "Amount (₹)": round(float(salary_amount), 2), "Type": "Income", "flow": "in"})
 
     # INCOME: extra inflows in this month
@@ -407,49 +408,47 @@ def cashflow_section(df, BILL_CYCLES, today, salary_amount, salary_payday, cash_
             events.append({"Date": d, "Event": f"Extra: {src}", "Amount (₹)": amt, "Type": "Income", "flow": "in"})
 
     # OUT: CC bills due
+    # all cards' due windows first, then one grouped pass over the transactions for the totals
     rows_due_sidebar = []
-    for card in sorted(BILL_CYCLES.keys() | st.session_state.new_card_cycles.keys()):
-        cstart_s, cend_s, bill_dt_s, due_dt_s = find_cycle_due_in_month(card, today.year, today.month, BILL_CYCLES)
-        mask_s = (
-            (df["Card"] == card)
-            & (df["type"].str.lower().eq("expense"))
-            & (df["Amount"] > 0)
-            & (df["Date"].dt.date >= cstart_s)
-            & (df["Date"].dt.date <= cend_s)
-        )
-        payable_s = round(float(df.loc[mask_s, "Amount"].sum()), 2)
+    cards = sorted_cards(BILL_CYCLES)
+    due_windows = find_cycles_due_in_month(BILL_CYCLES, cards, today.year, today.month)
+    due_totals = cached_liability_totals(data_key, df, {card: due_windows[card][:2] for card in cards})
+    for card in cards:
+        payable_s = due_totals[card][0]
         if payable_s > 0:
-            rows_due_sidebar.append((card, due_dt_s, payable_s))
+            rows_due_sidebar.append((card, due_windows[card][3], payable_s))
     for card, dd, amt in rows_due_sidebar:
         if dd.month == today.month and dd.year == today.year:
             events.append({"Date": dd, "Event": f"{card} Bill Payment (CC)", "Amount (₹)": round(amt, 2), "Type": "CC Bill", "flow": "out"})
 
     # OUT: regulars/EMIs (unpaid)
-    for _, r in cash_out_df.iterrows():
-        if (not r["Paid"]) and (r["Due Date"].month == today.month) and (r["Due Date"].year == today.year):
-            events.append({"Date": r["Due Date"], "Event": r["Item"], "Amount (₹)": round(float(r["Amount (₹)"]), 2), "Type": "Regular/EMI", "flow": "out"})
+    due_month = pd.to_datetime(cash_out_df["Due Date"]).dt.to_period("M")
+    unpaid = cash_out_df[~cash_out_df["Paid"].astype(bool) & due_month.eq(pd.Period(today, "M"))]
+    for d, item, amt in zip(unpaid["Due Date"], unpaid["Item"], unpaid["Amount (₹)"]):
+        events.append({"Date": d, "Event": item, "Amount (₹)": round(float(amt), 2), "Type": "Regular/EMI", "flow": "out"})
 
     # sort (incomes before outflows on same date)
     def _priority(e):
         return (e["Date"], 0 if e["flow"] == "in" else 1, e["Event"])
     events = sorted(events, key=_priority)
 
-    rows2, total_in, total_out = [], 0.0, 0.0
-    for ev in events:
-        amt = round(float(ev["Amount (₹)"]), 2)
-        if ev["flow"] == "in":
-            balance = round(balance + amt, 2); total_in = round(total_in + amt, 2); disp = "+ " + f"₹{amt:,.2f}"
-        else:
-            balance = round(balance - amt, 2); total_out = round(total_out + amt, 2); disp = "- " + f"₹{amt:,.2f}"
-        rows2.append([ev["Date"], ev["Event"], disp, round(balance, 2)])
+    # Running balance as one cumsum over signed paise (exact, same as rounding after every step)
+    ev_df = pd.DataFrame(events, columns=["Date", "Event", "Amount (₹)", "Type", "flow"])
+    paise = np.rint(ev_df["Amount (₹)"].to_numpy(dtype=float) * 100).astype(np.int64)
+    inflow = ev_df["flow"].eq("in").to_numpy()
+    balance_p = round(balance * 100) + np.cumsum(np.where(inflow, paise, -paise))
+    total_in, total_out = paise[inflow].sum() / 100, paise[~inflow].sum() / 100
 
-    sim_df = pd.DataFrame(rows2, columns=["Date", "Event", "Amount (₹)", "Balance After (₹)"])
+    sim_df = pd.DataFrame({
+        "Date": ev_df["Date"],
+        "Event": ev_df["Event"],
+        "Amount (₹)": [f"{'+' if i else '-'} ₹{a:,.2f}" for i, a in zip(inflow, paise / 100)],
+        "Balance After (₹)": balance_p / 100,
+    })
 
-    def style_low_balance(df_in: pd.DataFrame):
-        styles = pd.DataFrame('', index=df_in.index, columns=df_in.columns)
-        styles.loc[df_in['Balance After (₹)'] < 0, 'Balance After (₹)'] = 'background-color: #ffcccc; color: red; font-weight: bold'
-        styles.loc[(df_in['Balance After (₹)'] >= 0) & (df_in['Balance After (₹)'] < float(st.session_state.get('override_extra_buf', 0))) , 'Balance After (₹)'] = 'background-color: #ffefcc'
-        return styles
+    # Low-balance flags as a plain column (🔴 below zero, 🟠 below the buffer) instead of a Styler
+    bal = sim_df["Balance After (₹)"].to_numpy(dtype=float)
+    sim_df["⚠"] = np.select([bal < 0, bal < float(extra_buffer)], ["🔴", "🟠"], default="")
 
     st.markdown(
         f"**Starting Cash Balance:** ₹{float(start_balance):,.2f}  "
@@ -459,43 +458,43 @@ def cashflow_section(df, BILL_CYCLES, today, salary_amount, salary_payday, cash_
         f"| **Net Change:** ₹{(total_in - total_out):,.2f}"
     )
     st.dataframe(
-        sim_df.style.apply(style_low_balance, axis=None).format({
-            "Balance After (₹)": "₹{:,.2f}"
-        }),
-        use_container_width=True, hide_index=True
+        sim_df,
+        use_container_width=True, hide_index=True,
+        column_config={"Balance After (₹)": st.column_config.NumberColumn(format="₹%.2f")},
     )
 
 # ---------- Expenses by card ----------
-def expenses_by_card_section(df, BILL_CYCLES, today):
+def expenses_by_card_section(df, data_key, BILL_CYCLES, today):
     st.markdown("---")
     st.header("🧾 Expenses by Card (cycle that **generates** in selected month)")
-    summary_rows = []
     per_card_transactions = {}
-    for card in sorted(BILL_CYCLES.keys() | st.session_state.new_card_cycles.keys()):
+    rows_by_card = cached_expense_rows_by_card(data_key, df)
+    cards = sorted_cards(BILL_CYCLES)
+    for card in cards:
         cstart, cend, bill_dt, due_dt = get_overridden_cycle(card, today.year, today.month, BILL_CYCLES)
-        mask = (
-            (df["Card"] == card)
-            & (df["type"].str.lower().eq("expense"))
-            & (df["Amount"] > 0)
-            & (df["Date"].dt.date >= cstart)
-            & (df["Date"].dt.date <= cend)
-        )
-        sub = df.loc[mask, ["Date", "Category", "Amount", "Note", "Payment mode", "Tags"]].copy().sort_values("Date")
-        if not sub.empty:
-            sub["Amount"] = sub["Amount"].round(2)
-        amount = round(float(sub["Amount"].sum() if not sub.empty else 0.0), 2)
-        txn_count = int(sub.shape[0])
+        sub, amount, txn_count = sum_liability(df, card, cstart, cend, rows_by_card)
         per_card_transactions[card] = {"window": (cstart, cend, bill_dt, due_dt), "df": sub, "amount": amount, "count": txn_count}
-        summary_rows.append({
-            "Card": card, "Transactions": txn_count, "Cycle Liability (₹)": round(amount, 2),
-            "Cycle Start": cstart, "Cycle End (Bill Gen)": cend, "Due Date": due_dt
-        })
-    summary_df = pd.DataFrame(summary_rows)
+    details = [per_card_transactions[c] for c in cards]
+    summary_df = pd.DataFrame({
+        "Card": cards,
+        "Transactions": [d["count"] for d in details],
+        "Cycle Liability (₹)": [round(d["amount"], 2) for d in details],
+        "Cycle Start": [d["window"][0] for d in details],
+        "Cycle End (Bill Gen)": [d["window"][1] for d in details],
+        "Due Date": [d["window"][3] for d in details],
+    })
     st.dataframe(
-        summary_df.style.format({"Cycle Liability (₹)": "₹{:,.2f}"}),
-        use_container_width=True, hide_index=True
+        summary_df, use_container_width=True, hide_index=True,
+        column_config={"Cycle Liability (₹)": st.column_config.NumberColumn(format="₹%.2f")},
     )
-    for card in sorted(BILL_CYCLES.keys() | st.session_state.new_card_cycles.keys()):
+    # every card's category breakdown from one groupby; each expander slices out its card
+    cycle_rows = {card: d["df"] for card, d in per_card_transactions.items() if not d["df"].empty}
+    if cycle_rows:
+        cat_totals = (
+            pd.concat(cycle_rows, names=["Card", None])
+              .groupby(["Card", "Category"], dropna=False, observed=True)["Amount"].sum()
+        )
+    for card in cards:
         detail = per_card_transactions[card]
         cstart, cend, bill_dt, due_dt = detail["window"]
         sub = detail["df"]
@@ -505,118 +504,136 @@ def expenses_by_card_section(df, BILL_CYCLES, today):
             if sub.empty:
                 st.info("No transactions for this cycle.")
             else:
-                category_breakdown = sub.groupby("Category", dropna=False)["Amount"].sum().reset_index().sort_values("Amount", ascending=False)
+                category_breakdown = cat_totals.xs(card, level="Card").reset_index().sort_values("Amount", ascending=False)
                 category_breakdown["% of Total"] = (category_breakdown["Amount"] / total_amt) * 100
                 st.markdown("**Category Breakdown**")
                 st.dataframe(
-                    category_breakdown.assign(Amount=lambda d: d["Amount"].round(2)).style.format({
-                        "Amount": "₹{:,.2f}",
-                        "% of Total": "{:.1f}%"
-                    }),
-                    use_container_width=True, hide_index=True
+                    category_breakdown.assign(Amount=lambda d: d["Amount"].round(2)),
+                    use_container_width=True, hide_index=True,
+                    column_config={
+                        "Amount": st.column_config.NumberColumn(format="₹%.2f"),
+                        "% of Total": st.column_config.NumberColumn(format="%.1f%%"),
+                    },
                 )
                 st.markdown("**Transactions (Cycle Window)**")
-                st.dataframe(sub.assign(Amount=sub["Amount"].round(2)).style.format({"Amount": "₹{:,.2f}"}),
-                             use_container_width=True, hide_index=True)
-                buf = io.StringIO()
-                sub_export = sub.copy()
-                sub_export["Amount"] = sub_export["Amount"].round(2)
-                sub_export.to_csv(buf, index=False)
+                sub_export = sub.assign(Amount=sub["Amount"].round(2))
+                st.dataframe(sub_export, use_container_width=True, hide_index=True,
+                             column_config={"Amount": st.column_config.NumberColumn(format="₹%.2f")})
+                file_name = f"{card}_cycle_{cstart}_to_{cend}.csv"
                 st.download_button(
                     f"Download {card} Cycle Transactions CSV",
-                    data=buf.getvalue(),
-                    file_name=f"{card}_cycle_{cstart}_to_{cend}.csv",
+                    data=csv_bytes(data_key, file_name, sub_export),
+                    file_name=file_name,
                     mime="text/csv"
                 )
 
 # ---------- Merchants ----------
-def merchants_section(df, BILL_CYCLES, today):
+def merchants_section(df, data_key, BILL_CYCLES, today):
     st.markdown("---")
     st.header("🏷️ Top Merchants per Card — choose analysis window")
     window_choice = st.radio("Window", ["Current Cycle (Generating Month)", "Last 3 months", "Last 6 months", "Last 12 months"], horizontal=True, index=1)
     use_current_cycle = (window_choice == "Current Cycle (Generating Month)")
-    if not use_current_cycle:
+    merchant_keys = ["Category", "Note"]
+    dates = df["Date"].to_numpy()
+    cards = sorted_cards(BILL_CYCLES)
+    if use_current_cycle:
+        # every card's cycle rows gathered up front, then the same single groupby as the month windows
+        rows_by_card = cached_expense_rows_by_card(data_key, df)
+        windows = {card: get_overridden_cycle(card, today.year, today.month, BILL_CYCLES)[:2] for card in cards}
+        rows = np.concatenate([card_window_rows(df, card, *windows[card], rows_by_card) for card in cards] or [np.empty(0, dtype=np.intp)])
+        window_totals = (
+            df.iloc[rows].groupby(["Card", *merchant_keys], dropna=False, observed=True, sort=False)["Amount"]
+            .sum().reset_index()
+        )
+    else:
+        # One window mask and one groupby for all cards; per-card views slice the totals.
         nmap = {"Last 3 months": 3, "Last 6 months": 6, "Last 12 months": 12}
         global_start, global_end = months_back(nmap[window_choice], today)
-    for card in sorted(BILL_CYCLES.keys() | st.session_state.new_card_cycles.keys()):
+        in_window = (
+            expense_mask(df)
+            & (df["Amount"].to_numpy() > 0)
+            & (dates >= np.datetime64(global_start))
+            & (dates < np.datetime64(global_end) + np.timedelta64(1, "D"))
+        )
+        window_totals = (
+            df.loc[in_window].groupby(["Card", *merchant_keys], dropna=False, observed=True, sort=False)["Amount"]
+            .sum().reset_index()
+        )
+        window_label = f"{global_start} → {global_end}"
+    for card in cards:
         if use_current_cycle:
-            cstart, cend, _, _ = get_overridden_cycle(card, today.year, today.month, BILL_CYCLES)
-            mask = (df["Card"] == card) & (df["Date"].dt.date >= cstart) & (df["Date"].dt.date <= cend)
-            window_label = f"{cstart} → {cend}"
-        else:
-            mask = (df["Card"] == card) & (df["Date"].dt.date >= global_start) & (df["Date"].dt.date <= global_end)
-            window_label = f"{global_start} → {global_end}"
-        sub = df.loc[mask & (df["type"].str.lower().eq("expense")) & (df["Amount"] > 0), ["Date", "Category", "Note", "Amount"]].copy()
+            window_label = f"{windows[card][0]} → {windows[card][1]}"
+        totals = window_totals.loc[window_totals["Card"] == card, [*merchant_keys, "Amount"]]
         with st.expander(f"**{card}** — Top Merchants | Window: {window_label}"):
-            if sub.empty:
+            if totals.empty:
                 st.info("No expense transactions in this window.")
             else:
-                top = sub.groupby(["Category", "Note"], dropna=False)["Amount"].sum().reset_index().sort_values("Amount", ascending=False)
-                st.dataframe(top.head(10).assign(Amount=lambda d: d["Amount"].round(2))
-                            .style.format({"Amount": "₹{:,.2f}"}),
-                            use_container_width=True, hide_index=True)
-                buf = io.StringIO()
-                top_export = top.copy()
-                top_export["Amount"] = top_export["Amount"].round(2)
-                top_export.to_csv(buf, index=False)
+                top = totals.nlargest(10, "Amount")
+                st.dataframe(top.assign(Amount=lambda d: d["Amount"].round(2)), use_container_width=True, hide_index=True,
+                             column_config={"Amount": st.column_config.NumberColumn(format="₹%.2f")})
+                top_export = totals.sort_values("Amount", ascending=False)
                 st.download_button(
                     f"Download Top Merchants — {card}",
-                    data=buf.getvalue(),
+                    data=csv_bytes(
+                        data_key, f"top_merchants::{card}::{window_label}",
+                        top_export.assign(Amount=top_export["Amount"].round(2)),
+                    ),
                     file_name=f"top_merchants_{card}_{window_choice.replace(' ', '_')}.csv",
                     mime="text/csv"
                 )
 
 # ---------- Trends ----------
-def trends_section(monthly: pd.DataFrame, BILL_CYCLES, today: date):
+@st.fragment  # window/card pickers rerun only this section, with the latest full run's monthly/today
+def trends_section(monthly: pd.DataFrame, data_key, BILL_CYCLES, today: date):
     st.markdown("---")
     st.header("📈 Monthly Trends, MoM % Change, & Anomalies")
 
     window = st.radio("Window", ["Last 6 months", "Last 12 months", "All Time"], horizontal=True, index=1)
-    exclude_current_month_from_anomaly = st.checkbox("Exclude selected month from anomaly calculations", value=True)
+    c_hl, c_ex = st.columns(2)
+    highlight_anomalies = c_hl.checkbox("Highlight anomalies", value=True)  # CSS matrix is cached; untick for a plain table
+    exclude_current_month_from_anomaly = c_ex.checkbox(
+        "Exclude selected month from anomaly calculations", value=True, disabled=not highlight_anomalies
+    )
     n_months = 12 if window != "Last 6 months" else 6
-    m = monthly.copy()
-    if window != "All Time" and m.shape[0] > n_months:
-        m = m.iloc[-n_months:, :]
+    # read-only below (chart, cached table, CSV), so a view is enough
+    m = monthly.iloc[-n_months:] if (window != "All Time" and monthly.shape[0] > n_months) else monthly
 
-    available_cards = sorted([c for c in m.columns if pd.notna(c) and (c in BILL_CYCLES or c in st.session_state.new_card_cycles)])
+    valid_cards = BILL_CYCLES.keys() | st.session_state.new_card_cycles.keys()
+    available_cards = sorted(c for c in m.columns if pd.notna(c) and c in valid_cards)
     selected_cards = st.multiselect("Choose cards to analyze", options=available_cards, default=available_cards)
     if not selected_cards:
         st.info("Select at least one card to analyze monthly trends.")
         return
 
-    mom = m.pct_change().replace([np.inf, -np.inf], np.nan) * 100.0
-    combined_df = m.copy()
-    for card in selected_cards:
-        combined_df[f"{card} MoM %"] = mom[card]
-    combined_df = combined_df[sorted(combined_df.columns)].copy().round(2)
-
-    def style_anomalies_and_caps(df_in: pd.DataFrame) -> pd.DataFrame:
-        df_out = pd.DataFrame('', index=df_in.index, columns=df_in.columns)
-        this_ym = f"{today.year}-{str(today.month).zfill(2)}"
-        for col in [c for c in df_in.columns if "MoM %" not in c]:
-            series_for_med = df_in[col]
-            if exclude_current_month_from_anomaly and (len(df_in.index) > 0) and (df_in.index[-1] == this_ym):
-                series_for_med = series_for_med.iloc[:-1]
-            med = series_for_med[series_for_med > 0].median()
-            if med and med > 0:
-                is_anom = df_in[col] > 1.5 * med
-                df_out.loc[is_anom, col] = "background-color: #f7a5a5; font-weight: bold"
-        return df_out
+    combined_df = compute_trends_table(m, tuple(selected_cards))
 
     st.subheader("📊 Trend Chart")
-    st.line_chart(m[selected_cards].copy())
+    st.line_chart(m.loc[:, selected_cards])  # serialized to Arrow immediately; no defensive copy
 
     st.subheader("Monthly Totals (₹) and MoM % Change")
-    format_dict = {c: "₹{:,.2f}" for c in m.columns}
-    format_dict.update({c: "{:.1f}%" for c in combined_df.columns if "MoM %" in c})
-    st.dataframe(
-        combined_df.style.apply(style_anomalies_and_caps, axis=None).format(format_dict),
-        use_container_width=True
-    )
+    if highlight_anomalies:
+        # Styler path emits per-cell CSS; the CSS matrix is cached with the table
+        anomaly_css = trend_anomaly_styles(combined_df, exclude_current_month_from_anomaly, f"{today.year:04d}-{today.month:02d}")
+        format_dict = {c: ("{:.1f}%" if c.endswith(" MoM %") else "₹{:,.2f}") for c in combined_df.columns}
+        st.dataframe(
+            combined_df.style.apply(lambda _: anomaly_css, axis=None).format(format_dict),
+            use_container_width=True
+        )
+    else:
+        # plain frame + column formats: no Styler HTML
+        st.dataframe(
+            combined_df, use_container_width=True,
+            column_config={
+                c: st.column_config.NumberColumn(format="%.1f%%" if c.endswith(" MoM %") else "₹%.2f")
+                for c in combined_df.columns
+            },
+        )
+    file_name = f"monthly_trends_{'all' if window=='All Time' else str(n_months)+'m'}.csv"
     st.download_button(
         "Download Monthly Trends Data (CSV)",
-        data=m[selected_cards].round(2).to_csv().encode('utf-8'),
-        file_name=f"monthly_trends_{'all' if window=='All Time' else str(n_months)+'m'}.csv",
+        # monthly totals are already rounded to 2dp
+        data=csv_bytes(data_key, f"{file_name}::{'|'.join(selected_cards)}", m[selected_cards], index=True),
+        file_name=file_name,
         mime="text/csv"
     )
 
@@ -625,16 +642,10 @@ def plan_section(DEBTS, REGULARS):
     st.markdown("---")
     st.header("🎯 1-Year Financial Action Plan: Debt & Investment")
 
-    unsecured_debt = pd.DataFrame(DEBTS)
+    unsecured_debt = items_frame(DEBTS)
     unsecured_debt = unsecured_debt[unsecured_debt["item"] != "Home Loan EMI"].copy()
 
-    def _to_num(x):
-        try:
-            return int(x)
-        except Exception:
-            return np.nan
-
-    unsecured_debt["tenure_num"] = unsecured_debt["tenure_left"].apply(_to_num)
+    unsecured_debt["tenure_num"] = pd.to_numeric(unsecured_debt["tenure_left"], errors="coerce")  # "~95" -> NaN
     unsecured_debt_sorted = unsecured_debt.sort_values("tenure_num", na_position="last")
 
     if not unsecured_debt_sorted.empty and not unsecured_debt_sorted["tenure_num"].isna().all():